@@ -1,10 +1,17 @@
 from fastapi import APIRouter
 import pandas as pd
+import numpy as np
 import os
 import joblib
 import psycopg2
+from psycopg2 import pool
 from dotenv import load_dotenv
 
+try:
+    import connectorx as cx  # optional — Arrow-native Postgres reads
+except ImportError:
+    cx = None
+
 router = APIRouter(prefix="/api/customers", tags=["Customers"])
 
 # Load config & data
@@ -16,11 +23,29 @@ LOCAL_DATA_PATH = os.path.join(DATA_DIR, "merged_data.csv")
 
 NEON_CONN = os.getenv("NEON_CONN")
 
+# Pooled Neon connections — avoids a fresh TCP+TLS handshake per request.
+try:
+    POOL = pool.ThreadedConnectionPool(1, 8, NEON_CONN) if NEON_CONN else None
+except Exception:
+    POOL = None
+
 try:
     df_local = pd.read_csv(LOCAL_DATA_PATH, parse_dates=["month"])
 except Exception:
     df_local = pd.DataFrame()
 
+# Per-customer index built once — O(1) lookup instead of a full boolean
+# scan of df_local on every /api/customers/{id} request.
+df_local_by_id = (
+    {cid: sub for cid, sub in df_local.groupby("customer_id", sort=False)}
+    if not df_local.empty
+    else {}
+)
+
+
+def _local_customer(customer_id: str) -> pd.DataFrame:
+    return df_local_by_id.get(customer_id, pd.DataFrame()).copy()
+
 try:
     model = joblib.load(os.path.join(MODEL_DIR, "anomaly_model.pkl"))
     scaler = joblib.load(os.path.join(MODEL_DIR, "scaler.pkl"))
@@ -33,11 +58,16 @@ except Exception:
 def get_customers(limit: int = 50):
     """Return top suspicious customers (from Neon or local fallback)."""
     try:
-        if NEON_CONN:
-            conn = psycopg2.connect(NEON_CONN)
+        if POOL is not None:
             query = f"SELECT * FROM billing_data ORDER BY month DESC LIMIT {limit};"
-            df = pd.read_sql(query, conn)
-            conn.close()
+            if cx is not None:
+                df = cx.read_sql(NEON_CONN, query, protocol="binary")
+            else:
+                conn = POOL.getconn()
+                try:
+                    df = pd.read_sql(query, conn)
+                finally:
+                    POOL.putconn(conn)
         else:
             df = df_local.copy()
     except Exception:
@@ -53,7 +83,7 @@ def get_customers(limit: int = 50):
         X = df[["consumption_kwh", "billed_kwh", "ratio", "monthly_change"]].fillna(0)
         if scaler is not None:
             X = scaler.transform(X)
-        df["anomaly_score"] = model.score_samples(X)
+        df["anomaly_score"] = model.score_samples(np.ascontiguousarray(X, dtype=np.float32))
     else:
         df["anomaly_score"] = 0
 
@@ -70,16 +100,18 @@ def get_customers(limit: int = 50):
 @router.get("/{customer_id}")
 def get_customer_detail(customer_id: str):
     """Return full anomaly history for a single customer."""
-    if NEON_CONN:
+    if POOL is not None:
         try:
-            conn = psycopg2.connect(NEON_CONN)
-            query = "SELECT * FROM billing_data WHERE customer_id = %s ORDER BY month;"
-            df = pd.read_sql(query, conn, params=[customer_id])
-            conn.close()
+            conn = POOL.getconn()
+            try:
+                query = "SELECT * FROM billing_data WHERE customer_id = %s ORDER BY month;"
+                df = pd.read_sql(query, conn, params=[customer_id])
+            finally:
+                POOL.putconn(conn)
         except Exception:
-            df = df_local[df_local["customer_id"] == customer_id].copy()
+            df = _local_customer(customer_id)
     else:
-        df = df_local[df_local["customer_id"] == customer_id].copy()
+        df = _local_customer(customer_id)
 
     if df.empty:
         return {"error": "Customer not found"}
@@ -91,7 +123,7 @@ def get_customer_detail(customer_id: str):
         X = df[["consumption_kwh", "billed_kwh", "ratio", "monthly_change"]].fillna(0)
         if scaler is not None:
             X = scaler.transform(X)
-        df["anomaly_score"] = model.score_samples(X)
+        df["anomaly_score"] = model.score_samples(np.ascontiguousarray(X, dtype=np.float32))
     else:
         df["anomaly_score"] = 0
 
@@ -5,12 +5,13 @@ import pandas as pd
 import numpy as np
 import joblib
 from sklearn.neighbors import LocalOutlierFactor
-from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import precision_score, recall_score, f1_score, confusion_matrix
 from datetime import datetime
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+from utils.io import save_df, load_df
+
 # --------- Paths ---------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
@@ -22,165 +23,200 @@ LOG_FILE = os.path.join(BASE_DIR, "metrics_log.csv")
 RESULTS_FILE = os.path.join(DATA_DIR, "evaluation_results.csv")
 CONF_MATRIX_FILE = os.path.join(REPORTS_DIR, "confusion_matrix.png")
 
-# --------- Load Data & Model ---------
-data_path = os.path.join(DATA_DIR, "training_with_synthetics.csv")
-if not os.path.exists(data_path):
-    raise FileNotFoundError(f"❌ Dataset not found at {data_path}. Run train_model.py first!")
-
-df = pd.read_csv(data_path, parse_dates=["month"])
-iso = joblib.load(os.path.join(MODEL_DIR, "anomaly_model.pkl"))  # IsolationForest
-
-# --------- Load Best Params ---------
-best_params_path = os.path.join(MODEL_DIR, "best_params.pkl")
-if os.path.exists(best_params_path):
-    best_params = joblib.load(best_params_path)
-    print("✅ Loaded best params for evaluation:", best_params)
-else:
-    print("⚠️ No tuned params found, using defaults.")
-    best_params = {
-        "lof_n_neighbors": 20,
-        "lof_contamination": 0.05,
-        "alpha": 0.5,
-    }
-
-# --------- Features ---------
-features = ["consumption_kwh", "billed_kwh", "ratio", "monthly_change", "cat_dev", "billing_gap"]
-X = df[features].fillna(0)
-scaler = joblib.load(os.path.join(MODEL_DIR, "scaler.pkl"))
-X_scaled = scaler.transform(X)
-
-
-# --------- Step 1: Model Scores ---------
-df["iso_score"] = iso.score_samples(X_scaled)
-
-
-lof = LocalOutlierFactor(
-    n_neighbors=best_params.get("lof_n_neighbors", 20),
-    contamination=best_params.get("lof_contamination", 0.05),
-)
-df["lof_pred"] = lof.fit_predict(X_scaled)
-
-# --------- Step 2: Normalize Scores ---------
-scaler = MinMaxScaler()
-df["iso_norm"] = scaler.fit_transform(df[["iso_score"]])
-df["lof_norm"] = scaler.fit_transform(np.abs(df[["lof_pred"]]))  # LOF outputs -1/1 → abs makes it consistent
-
-alpha = best_params.get("alpha", 0.5)
-df["combined_score"] = alpha * df["iso_norm"] + (1 - alpha) * df["lof_norm"]
-
-# --------- Step 3: Rule-based Anomaly Flags ---------
-under_flag = (df["ratio"] < 0.85).astype(int)
-over_flag = (df["ratio"] > 1.3).astype(int)
-df["rule_flag"] = under_flag | over_flag
-
-# Mild penalty for rule-based anomalies
-df["final_score"] = df["combined_score"] - df["rule_flag"] * 0.2
-
-# --------- Step 4: True Labels (BEFORE auto-threshold!) ---------
-if "is_synthetic" in df.columns:
-    df["true_label"] = df["is_synthetic"].apply(lambda x: -1 if x == 1 else 1)
-else:
-    print("⚠️ No synthetic labels found! Falling back to random labels.")
-    df["true_label"] = 1
-    fraud_idx = df.sample(30, random_state=42).index
-    df.loc[fraud_idx, "true_label"] = -1
-
-
-# --------- Step 5: Auto-Tune Threshold ---------
-best_threshold = None
-best_f1 = -1
-best_precision = 0
-best_recall = 0
-for q in np.linspace(0.01, 0.15, 30):
-    temp_label = np.where(df["final_score"] < df["final_score"].quantile(q), -1, 1)
-
-    precision_q = precision_score(df["true_label"], temp_label, pos_label=-1, zero_division=0)
-    recall_q = recall_score(df["true_label"], temp_label, pos_label=-1, zero_division=0)
-    f1_q = f1_score(df["true_label"], temp_label, pos_label=-1, zero_division=0)
-
-    # pick best quantile by F1 (tie broken by precision)
-    if f1_q > best_f1 or (f1_q == best_f1 and precision_q > best_precision):
-        best_f1 = f1_q
-        best_precision = precision_q
-        best_recall = recall_q
-        best_threshold = q
-
-# fallback if not found
-if best_threshold is None:
-    best_threshold = 0.05
-
-# Apply best threshold to create final predictions
-df["pred"] = np.where(df["final_score"] < df["final_score"].quantile(best_threshold), -1, 1)
-
-# --------- Step 5b: Persistence filter based on predictions (2+ consecutive anomalies) ---------
-df["persistent_anomaly"] = (
-    df.groupby("customer_id")["pred"]
-    .rolling(2)
-    .apply(lambda x: (x == -1).sum(), raw=True)
-    .reset_index(0, drop=True)
-    .ge(2)
-    .astype(int)
-)
-
-print(f"⚙️ Auto-tuned quantile: {best_threshold:.3f} (F1={best_f1:.3f}, P={best_precision:.3f}, R={best_recall:.3f})")
-
-
-# --------- Step 6: Metrics ---------
-precision = precision_score(df["true_label"], df["pred"], pos_label=-1, zero_division=0)
-recall = recall_score(df["true_label"], df["pred"], pos_label=-1, zero_division=0)
-f1 = f1_score(df["true_label"], df["pred"], pos_label=-1, zero_division=0)
-
-print("\n📊 Evaluation Results (Improved Hybrid Logic):")
-print(f"Precision: {precision:.3f}")
-print(f"Recall:    {recall:.3f}")
-print(f"F1 Score:  {f1:.3f}")
-
-# --------- Step 7: Confusion Matrix ---------
-cm = confusion_matrix(df["true_label"], df["pred"], labels=[-1, 1])
-plt.figure(figsize=(5, 4))
-sns.heatmap(cm, annot=True, fmt="d", cmap="Blues",
-            xticklabels=["Fraud", "Normal"],
-            yticklabels=["Fraud", "Normal"])
-plt.xlabel("Predicted")
-plt.ylabel("Actual")
-plt.title("Confusion Matrix (Persistent Anomalies)")
-plt.tight_layout()
-plt.savefig(CONF_MATRIX_FILE)
-print(f"📊 Confusion matrix plot saved to {CONF_MATRIX_FILE}")
-plt.show()
-
-# --------- Step 8: Save Per-Customer Results ---------
-results = (
-    df.groupby("customer_id")
-      .agg(
-          avg_score=("final_score", "mean"),
-          predicted_label=("pred", lambda x: -1 if (x == -1).sum() > 0 else 1),
-          true_label=("true_label", lambda x: -1 if (x == -1).sum() > 0 else 1),
-          persistent_anomaly=("persistent_anomaly", "max"),
-          synthetic_flags=("is_synthetic", "sum")
-      )
-      .reset_index()
-      .sort_values("avg_score")
-)
-
-results.to_csv(RESULTS_FILE, index=False)
-print(f"✅ Detailed evaluation results saved to {RESULTS_FILE}")
-
-# --------- Step 9: Logging ---------
-new_log = pd.DataFrame([{
-    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-    "precision": round(precision, 3),
-    "recall": round(recall, 3),
-    "f1_score": round(f1, 3),
-    "notes": "Improved hybrid evaluation (normalized + persistence)"
-}])
-
-if os.path.exists(LOG_FILE):
-    log = pd.read_csv(LOG_FILE)
-    log = pd.concat([log, new_log], ignore_index=True)
-else:
-    log = new_log
-
-log.to_csv(LOG_FILE, index=False)
-print(f"✅ Metrics logged to {LOG_FILE}")
-print("✅ Evaluation complete using normalized hybrid model with persistence.")
+
+def _minmax(a: np.ndarray) -> np.ndarray:
+    """Closed-form min-max scaling — no sklearn object allocation or
+    validation overhead for a one-column rescale."""
+    lo = a.min()
+    return (a - lo) / (a.max() - lo + 1e-12)
+
+
+def main(df: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Evaluate the hybrid model; accepts the featurized frame from
+    train_model.main() to skip the CSV round trip when run in-process."""
+    # --------- Load Data & Model ---------
+    if df is None:
+        data_path = os.path.join(DATA_DIR, "training_with_synthetics.csv")
+        if not os.path.exists(data_path) and not os.path.exists(
+            os.path.splitext(data_path)[0] + ".parquet"
+        ):
+            raise FileNotFoundError(f"❌ Dataset not found at {data_path}. Run train_model.py first!")
+        # Parquet sibling preferred — dtypes preserved, no text re-parse
+        df = load_df(
+            data_path,
+            engine="pyarrow",
+            dtype={"customer_id": "category", "consumer_category": "category",
+                   "consumption_kwh": "float32", "billed_kwh": "float32"},
+            parse_dates=["month"],
+        )
+    else:
+        # Work on a copy — this stage overwrites persistent_anomaly with
+        # flags derived from its own auto-tuned predictions, and the
+        # caller's frame must keep train_model's labels (what a standalone
+        # run reads back from training_with_synthetics.csv)
+        df = df.copy()
+    # Categorical key once up front — every groupby below hashes int codes
+    df["customer_id"] = df["customer_id"].astype("category")
+    iso = joblib.load(os.path.join(MODEL_DIR, "anomaly_model.pkl"))  # IsolationForest
+
+    # --------- Load Best Params ---------
+    best_params_path = os.path.join(MODEL_DIR, "best_params.pkl")
+    if os.path.exists(best_params_path):
+        best_params = joblib.load(best_params_path)
+        print("✅ Loaded best params for evaluation:", best_params)
+    else:
+        print("⚠️ No tuned params found, using defaults.")
+        best_params = {
+            "lof_n_neighbors": 20,
+            "lof_contamination": 0.05,
+            "alpha": 0.5,
+        }
+
+    # --------- Features ---------
+    features = ["consumption_kwh", "billed_kwh", "ratio", "monthly_change", "cat_dev", "billing_gap"]
+    # Bare float32 ndarray (na_value fills during extraction) — the scaler
+    # was fit on an ndarray in train_model.py, so transforming a DataFrame
+    # here would warn about mismatched feature names on every run
+    X = df[features].to_numpy(dtype=np.float32, na_value=0.0)
+    scaler = joblib.load(os.path.join(MODEL_DIR, "scaler.pkl"))
+    X_scaled = scaler.transform(X)
+
+    # --------- Step 1: Model Scores ---------
+    df["iso_score"] = iso.score_samples(X_scaled)
+
+    # Contiguous float32 halves the distance-kernel bandwidth; n_jobs=-1 runs
+    # the k-NN search across all cores.
+    X32 = np.ascontiguousarray(X_scaled, dtype=np.float32)
+    lof = LocalOutlierFactor(
+        n_neighbors=best_params.get("lof_n_neighbors", 20),
+        contamination=best_params.get("lof_contamination", 0.05),
+        n_jobs=-1,
+    )
+    df["lof_pred"] = lof.fit_predict(X32)
+    # Continuous LOF score (higher = more inlying) — the hard -1/1 labels
+    # collapse to a constant after abs(), which made lof_norm useless.
+    df["lof_score"] = lof.negative_outlier_factor_
+
+    # --------- Step 2: Normalize Scores ---------
+    df["iso_norm"] = _minmax(df["iso_score"].to_numpy())
+    df["lof_norm"] = _minmax(df["lof_score"].to_numpy())
+
+    alpha = best_params.get("alpha", 0.5)
+    df["combined_score"] = alpha * df["iso_norm"] + (1 - alpha) * df["lof_norm"]
+
+    # --------- Step 3: Rule-based Anomaly Flags ---------
+    under_flag = (df["ratio"] < 0.85).astype(int)
+    over_flag = (df["ratio"] > 1.3).astype(int)
+    df["rule_flag"] = under_flag | over_flag
+
+    # Mild penalty for rule-based anomalies
+    df["final_score"] = df["combined_score"] - df["rule_flag"] * 0.2
+
+    # --------- Step 4: True Labels (BEFORE auto-threshold!) ---------
+    if "is_synthetic" in df.columns:
+        df["true_label"] = df["is_synthetic"].apply(lambda x: -1 if x == 1 else 1)
+    else:
+        print("⚠️ No synthetic labels found! Falling back to random labels.")
+        df["true_label"] = 1
+        fraud_idx = df.sample(30, random_state=42).index
+        df.loc[fraud_idx, "true_label"] = -1
+
+    # --------- Step 5: Auto-Tune Threshold ---------
+    best_threshold = None
+    best_f1 = -1
+    best_precision = 0
+    best_recall = 0
+    for q in np.linspace(0.01, 0.15, 30):
+        temp_label = np.where(df["final_score"] < df["final_score"].quantile(q), -1, 1)
+
+        precision_q = precision_score(df["true_label"], temp_label, pos_label=-1, zero_division=0)
+        recall_q = recall_score(df["true_label"], temp_label, pos_label=-1, zero_division=0)
+        f1_q = f1_score(df["true_label"], temp_label, pos_label=-1, zero_division=0)
+
+        # pick best quantile by F1 (tie broken by precision)
+        if f1_q > best_f1 or (f1_q == best_f1 and precision_q > best_precision):
+            best_f1 = f1_q
+            best_precision = precision_q
+            best_recall = recall_q
+            best_threshold = q
+
+    # fallback if not found
+    if best_threshold is None:
+        best_threshold = 0.05
+
+    # Apply best threshold to create final predictions
+    df["pred"] = np.where(df["final_score"] < df["final_score"].quantile(best_threshold), -1, 1)
+
+    # --------- Step 5b: Persistence filter based on predictions (2+ consecutive anomalies) ---------
+    # "Anomaly in 2+ consecutive months" is just current & previous both -1 —
+    # one grouped shift + bitwise AND instead of the rolling-apply machinery.
+    prev_pred = df.groupby("customer_id", sort=False, observed=True)["pred"].shift(1)
+    df["persistent_anomaly"] = ((df["pred"] == -1) & (prev_pred == -1)).astype(np.int8)
+
+    print(f"⚙️ Auto-tuned quantile: {best_threshold:.3f} (F1={best_f1:.3f}, P={best_precision:.3f}, R={best_recall:.3f})")
+
+    # --------- Step 6: Metrics ---------
+    precision = precision_score(df["true_label"], df["pred"], pos_label=-1, zero_division=0)
+    recall = recall_score(df["true_label"], df["pred"], pos_label=-1, zero_division=0)
+    f1 = f1_score(df["true_label"], df["pred"], pos_label=-1, zero_division=0)
+
+    print("\n📊 Evaluation Results (Improved Hybrid Logic):")
+    print(f"Precision: {precision:.3f}")
+    print(f"Recall:    {recall:.3f}")
+    print(f"F1 Score:  {f1:.3f}")
+
+    # --------- Step 7: Confusion Matrix ---------
+    cm = confusion_matrix(df["true_label"], df["pred"], labels=[-1, 1])
+    plt.figure(figsize=(5, 4))
+    sns.heatmap(cm, annot=True, fmt="d", cmap="Blues",
+                xticklabels=["Fraud", "Normal"],
+                yticklabels=["Fraud", "Normal"])
+    plt.xlabel("Predicted")
+    plt.ylabel("Actual")
+    plt.title("Confusion Matrix (Persistent Anomalies)")
+    plt.tight_layout()
+    plt.savefig(CONF_MATRIX_FILE)
+    print(f"📊 Confusion matrix plot saved to {CONF_MATRIX_FILE}")
+    plt.show()
+
+    # --------- Step 8: Save Per-Customer Results ---------
+    results = (
+        df.groupby("customer_id", sort=False, observed=True)
+          .agg(
+              avg_score=("final_score", "mean"),
+              predicted_label=("pred", lambda x: -1 if (x == -1).sum() > 0 else 1),
+              true_label=("true_label", lambda x: -1 if (x == -1).sum() > 0 else 1),
+              persistent_anomaly=("persistent_anomaly", "max"),
+              synthetic_flags=("is_synthetic", "sum")
+          )
+          .reset_index()
+          .sort_values("avg_score")
+    )
+
+    save_df(results, RESULTS_FILE)
+    print(f"✅ Detailed evaluation results saved to {RESULTS_FILE}")
+
+    # --------- Step 9: Logging ---------
+    new_log = pd.DataFrame([{
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "precision": round(precision, 3),
+        "recall": round(recall, 3),
+        "f1_score": round(f1, 3),
+        "notes": "Improved hybrid evaluation (normalized + persistence)"
+    }])
+
+    if os.path.exists(LOG_FILE):
+        log = pd.read_csv(LOG_FILE)
+        log = pd.concat([log, new_log], ignore_index=True)
+    else:
+        log = new_log
+
+    log.to_csv(LOG_FILE, index=False)
+    print(f"✅ Metrics logged to {LOG_FILE}")
+    print("✅ Evaluation complete using normalized hybrid model with persistence.")
+
+    return df
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,14 @@
 # generate_top50.py
 import os
 import pandas as pd
+import numpy as np
 import joblib
-from sklearn.preprocessing import MinMaxScaler
+from joblib import parallel_backend
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 
-# Load dataset
-df = pd.read_csv(os.path.join(DATA_DIR, "dummy_billing_dataset.csv"), parse_dates=["month"])
-
-# -------- Feature Engineering (same as train_model.py) --------
-def add_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.sort_values(["customer_id", "month"]).copy()
-    df["ratio"] = df["billed_kwh"] / (df["consumption_kwh"] + 1)
-    df["monthly_change"] = df.groupby("customer_id")["consumption_kwh"].diff().fillna(0)
-    cat_avg = df.groupby("consumer_category")["consumption_kwh"].transform("mean")
-    df["cat_dev"] = df["consumption_kwh"] - cat_avg
-    df["billing_gap"] = df["consumption_kwh"] - df["billed_kwh"]
-    return df
-
-df = add_features(df)
-
 FEATURES = [
     "consumption_kwh",
     "billed_kwh",
@@ -32,33 +18,88 @@ FEATURES = [
     "billing_gap",
 ]
 
-# -------- Load model + scaler --------
+# -------- Load model --------
 model_path = os.path.join(MODEL_DIR, "anomaly_model.pkl")
 scaler_path = os.path.join(MODEL_DIR, "scaler.pkl")
 
-if not (os.path.exists(model_path) and os.path.exists(scaler_path)):
-    raise FileNotFoundError("❌ Missing trained model/scaler. Run train_model.py first!")
+if not os.path.exists(model_path):
+    raise FileNotFoundError("❌ Missing trained model. Run train_model.py first!")
 
 iso = joblib.load(model_path)
-scaler = joblib.load(scaler_path)
+
+# -------- Build the scaled feature matrix --------
+# train_model.py caches a scaled matrix of the clean (pre-injection)
+# features plus a row-aligned customer index; loading those skips the CSV
+# parse, feature engineering and scaler.transform while producing the
+# same scores as the fallback below. Fall back to the full path when the
+# cache is missing or older than the raw dataset.
+csv_path = os.path.join(DATA_DIR, "dummy_billing_dataset.csv")
+x_path = os.path.join(DATA_DIR, "X_scaled.npy")
+idx_path = os.path.join(DATA_DIR, "customer_index.parquet")
+
+use_cache = (
+    os.path.exists(x_path)
+    and os.path.exists(idx_path)
+    and (not os.path.exists(csv_path) or os.path.getmtime(x_path) >= os.path.getmtime(csv_path))
+)
+
+if use_cache:
+    X_scaled = np.load(x_path)
+    customer_ids = pd.read_parquet(idx_path)["customer_id"]
+else:
+    # Load dataset — explicit dtypes (categorical keys, float32 kwh) and the
+    # multi-threaded Arrow CSV parser
+    BILLING_DTYPES = {
+        "customer_id": "category",
+        "consumer_category": "category",
+        "consumption_kwh": "float32",
+        "billed_kwh": "float32",
+    }
+    df = pd.read_csv(
+        csv_path,
+        engine="pyarrow",
+        dtype=BILLING_DTYPES,
+        parse_dates=["month"],
+    )
+
+    # Feature Engineering (shared fused kernel from train_model.py)
+    from train_model import add_features
+
+    df = add_features(df)
+
+    if not os.path.exists(scaler_path):
+        raise FileNotFoundError("❌ Missing trained scaler. Run train_model.py first!")
+    scaler = joblib.load(scaler_path)
+
+    # float32 from extraction onward — half the bytes through the
+    # forest's tree traversal
+    X = df[FEATURES].to_numpy(dtype=np.float32, na_value=0.0)
+    X_scaled = np.ascontiguousarray(scaler.transform(X), dtype=np.float32)
+    customer_ids = df["customer_id"]
 
 # -------- Apply model --------
-X = df[FEATURES].fillna(0)
-X_scaled = scaler.transform(X)
+# One ensemble traversal, fanned out across cores via the threading
+# backend (trees share X by reference — no pickling). Labels derive from
+# the scores against the fitted offset, exactly what predict() computes.
+iso.n_jobs = -1
+with parallel_backend("threading"):
+    scores = iso.score_samples(X_scaled)   # ✅ instead of decision_function
 
-df["anomaly_score"] = iso.score_samples(X_scaled)   # ✅ instead of decision_function
-df["anomaly_label"] = iso.predict(X_scaled)
+scored = pd.DataFrame({"customer_id": customer_ids.reset_index(drop=True), "anomaly_score": scores})
+scored["anomaly_label"] = np.where(scores < iso.offset_, -1, 1).astype(np.int8)
 
 # -------- Aggregate per customer --------
-customer_scores = (
-    df.groupby("customer_id")["anomaly_score"]
-    .mean()
-    .reset_index()
-    .sort_values("anomaly_score")   # lower = more anomalous
-)
+# Per-customer mean via two bincounts over factorized ids — one C loop
+# each, no hash-groupby machinery for a plain numeric reduction
+codes, uniques = pd.factorize(scored["customer_id"], sort=False)
+sums = np.bincount(codes, weights=scores)
+counts = np.bincount(codes)
+customer_scores = pd.DataFrame({"customer_id": uniques, "anomaly_score": sums / counts})
 
 # -------- Save top 50 --------
-top50 = customer_scores.head(50)
+# Partial selection (introselect) — no full sort of all customers just to
+# keep the 50 lowest scores (lower = more anomalous)
+top50 = customer_scores.nsmallest(50, "anomaly_score")
 out_file = os.path.join(DATA_DIR, "top50_suspicious_customers.csv")
 top50.to_csv(out_file, index=False)
 
@@ -2,8 +2,13 @@
 
 import os
 import pandas as pd
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # headless renders — skip the GUI backend import
 import matplotlib.pyplot as plt
 
+from utils.io import load_df
+
 # --------- Paths ---------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
@@ -18,107 +23,144 @@ OUTPUT_FILE = os.path.join(DATA_DIR, "merged_analysis.csv")
 TRUE_FRAUDS_FILE = os.path.join(DATA_DIR, "true_frauds.csv")
 SUMMARY_PLOT = os.path.join(REPORTS_DIR, "fraud_summary.png")
 
-# --------- Load Data ---------
-print("🔍 Loading input data...")
-train = pd.read_csv(TRAIN_FILE, parse_dates=["month"])
-top50 = pd.read_csv(TOP50_FILE)
-
-# --------- True Fraud Labels (synthetic ground truth) ---------
-fraud_labels = (
-    train.groupby("customer_id")["is_synthetic"]
-    .max()
-    .reset_index()
-    .rename(columns={"is_synthetic": "true_fraud"})
-)
-
-# --------- Merge with top 50 suspicious list ---------
-merged = top50.merge(fraud_labels, on="customer_id", how="left")
-
-# Compute persistent anomaly rate per customer (if available)
-if "persistent_anomaly" in train.columns:
-    persistence = (
-        train.groupby("customer_id")["persistent_anomaly"]
-        .mean()
-        .reset_index()
-        .rename(columns={"persistent_anomaly": "persistence_rate"})
+
+def main(train: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Merge the top-50 list with ground truth and evaluation results;
+    accepts the training frame in-process to skip the CSV re-read."""
+    # --------- Load Data ---------
+    print("🔍 Loading input data...")
+    if train is None:
+        # Parquet siblings preferred — dtypes preserved, no text re-parse
+        train = load_df(
+            TRAIN_FILE,
+            engine="pyarrow",
+            dtype={"customer_id": "category", "consumer_category": "category",
+                   "consumption_kwh": "float32", "billed_kwh": "float32"},
+            parse_dates=["month"],
+        )
+    top50 = load_df(TOP50_FILE)
+
+    # --------- True Fraud Labels (synthetic ground truth) ---------
+    # Factorize once; both per-customer reductions below are single
+    # bincount passes over the int codes instead of hash groupbys.
+    codes, uniques = pd.factorize(train["customer_id"], sort=False)
+    counts = np.bincount(codes)
+
+    # "any synthetic month" is a weighted bincount > 0 (per-group OR)
+    any_synthetic = np.bincount(codes, weights=train["is_synthetic"].to_numpy()) > 0
+    fraud_labels = pd.DataFrame({
+        "customer_id": uniques,
+        "true_fraud": any_synthetic.astype(np.int8),
+    })
+
+    # --------- Merge with top 50 suspicious list ---------
+    merged = top50.merge(fraud_labels, on="customer_id", how="left")
+
+    # Compute persistent anomaly rate per customer (if available)
+    if "persistent_anomaly" in train.columns:
+        persistence = pd.DataFrame({
+            "customer_id": uniques,
+            "persistence_rate": np.bincount(
+                codes, weights=train["persistent_anomaly"].to_numpy()
+            ) / counts,
+        })
+        merged = merged.merge(persistence, on="customer_id", how="left")
+
+    # One C-level compare+select instead of a Python lambda per row
+    merged["fraud_status"] = np.where(
+        merged["true_fraud"].to_numpy() == 1, "True Fraud", "False Alarm"
     )
-    merged = merged.merge(persistence, on="customer_id", how="left")
-
-merged["fraud_status"] = merged["true_fraud"].apply(
-    lambda x: "True Fraud" if x == 1 else "False Alarm"
-)
-
-# --------- Enhanced Merge with Evaluation Metrics ---------
-if os.path.exists(EVAL_RESULTS_FILE):
-    eval_results = pd.read_csv(EVAL_RESULTS_FILE)
-    merged = merged.merge(
-        eval_results[["customer_id", "predicted_label", "true_label", "avg_score"]],
-        on="customer_id",
-        how="left"
+
+    # --------- Enhanced Merge with Evaluation Metrics ---------
+    if os.path.exists(EVAL_RESULTS_FILE) or os.path.exists(
+        os.path.splitext(EVAL_RESULTS_FILE)[0] + ".parquet"
+    ):
+        eval_results = load_df(EVAL_RESULTS_FILE)
+        merged = merged.merge(
+            eval_results[["customer_id", "predicted_label", "true_label", "avg_score"]],
+            on="customer_id",
+            how="left"
+        )
+
+        # Two-valued columns: a branchless compare beats per-element dict
+        # lookups through Series.map
+        merged["predicted_label"] = np.where(
+            merged["predicted_label"].to_numpy() == -1, "Fraud", "Normal"
+        )
+        merged["true_label"] = np.where(
+            merged["true_label"].to_numpy() == -1, "Fraud", "Normal"
+        )
+
+        # Vectorized outcome classification — a handful of C-level mask
+        # comparisons instead of a Python call per row via apply(axis=1)
+        tl = merged["true_label"].to_numpy()
+        pl = merged["predicted_label"].to_numpy()
+        merged["detection_outcome"] = np.select(
+            [
+                (tl == "Fraud") & (pl == "Fraud"),
+                (tl == "Normal") & (pl == "Fraud"),
+                (tl == "Fraud") & (pl == "Normal"),
+            ],
+            [
+                "True Positive (Caught Fraud)",
+                "False Positive (False Alarm)",
+                "False Negative (Missed Fraud)",
+            ],
+            default="True Negative (Correct Normal)",
+        )
+    else:
+        print("⚠️ Evaluation results not found. Proceeding without evaluation merge.")
+        merged["detection_outcome"] = merged["fraud_status"]
+
+    # --------- Fraud Precision & Recall Summary ---------
+    if "detection_outcome" in merged.columns:
+        total_frauds = (merged["detection_outcome"] == "True Positive (Caught Fraud)").sum()
+        total_predicted = (merged["predicted_label"] == "Fraud").sum() if "predicted_label" in merged else 0
+        total_actual = (merged["true_label"] == "Fraud").sum() if "true_label" in merged else 0
+
+        precision = (total_frauds / total_predicted) if total_predicted else 0
+        recall = (total_frauds / total_actual) if total_actual else 0
+        merged.attrs["precision"] = precision
+        merged.attrs["recall"] = recall
+
+        print(f"\n🎯 Fraud Precision: {precision:.2%}")
+        print(f"🎯 Fraud Recall:    {recall:.2%}")
+
+    # --------- Save Reports ---------
+    merged.to_csv(OUTPUT_FILE, index=False)
+    print(f"✅ Merged report saved to {OUTPUT_FILE}")
+
+    true_frauds = merged[merged["fraud_status"] == "True Fraud"]
+    true_frauds.to_csv(TRUE_FRAUDS_FILE, index=False)
+    print(f"✅ True fraud customers saved to {TRUE_FRAUDS_FILE}")
+
+    # --------- Summary Table ---------
+    summary = (
+        merged["detection_outcome"].value_counts()
+        if "detection_outcome" in merged.columns
+        else merged["fraud_status"].value_counts()
     )
 
-    label_map = {-1: "Fraud", 1: "Normal"}
-    merged["predicted_label"] = merged["predicted_label"].map(label_map)
-    merged["true_label"] = merged["true_label"].map(label_map)
-
-    def classify_row(row):
-        if row["true_label"] == "Fraud" and row["predicted_label"] == "Fraud":
-            return "True Positive (Caught Fraud)"
-        elif row["true_label"] == "Normal" and row["predicted_label"] == "Fraud":
-            return "False Positive (False Alarm)"
-        elif row["true_label"] == "Fraud" and row["predicted_label"] == "Normal":
-            return "False Negative (Missed Fraud)"
-        else:
-            return "True Negative (Correct Normal)"
-
-    merged["detection_outcome"] = merged.apply(classify_row, axis=1)
-else:
-    print("⚠️ Evaluation results not found. Proceeding without evaluation merge.")
-    merged["detection_outcome"] = merged["fraud_status"]
-
-# --------- Fraud Precision & Recall Summary ---------
-if "detection_outcome" in merged.columns:
-    total_frauds = (merged["detection_outcome"] == "True Positive (Caught Fraud)").sum()
-    total_predicted = (merged["predicted_label"] == "Fraud").sum() if "predicted_label" in merged else 0
-    total_actual = (merged["true_label"] == "Fraud").sum() if "true_label" in merged else 0
-
-    precision = (total_frauds / total_predicted) if total_predicted else 0
-    recall = (total_frauds / total_actual) if total_actual else 0
-    merged.attrs["precision"] = precision
-    merged.attrs["recall"] = recall
-
-    print(f"\n🎯 Fraud Precision: {precision:.2%}")
-    print(f"🎯 Fraud Recall:    {recall:.2%}")
-
-# --------- Save Reports ---------
-merged.to_csv(OUTPUT_FILE, index=False)
-print(f"✅ Merged report saved to {OUTPUT_FILE}")
-
-true_frauds = merged[merged["fraud_status"] == "True Fraud"]
-true_frauds.to_csv(TRUE_FRAUDS_FILE, index=False)
-print(f"✅ True fraud customers saved to {TRUE_FRAUDS_FILE}")
-
-# --------- Summary Table ---------
-summary = (
-    merged["detection_outcome"].value_counts()
-    if "detection_outcome" in merged.columns
-    else merged["fraud_status"].value_counts()
-)
-
-print("\n📊 Summary Breakdown:")
-print(summary)
-
-# --------- Visualization ---------
-plt.figure(figsize=(7, 5))
-summary.plot(kind="bar", color=["green", "red", "orange", "blue"])
-plt.title("Fraud Detection Outcomes (Hybrid Model)")
-plt.xlabel("Outcome")
-plt.ylabel("Number of Customers")
-plt.xticks(rotation=25)
-plt.tight_layout()
-
-plt.savefig(SUMMARY_PLOT)
-print(f"📈 Fraud summary plot saved to {SUMMARY_PLOT}")
-plt.show()
-
-print("\n✅ merge_and_analyze.py completed successfully.")
+    print("\n📊 Summary Breakdown:")
+    print(summary)
+
+    # --------- Visualization ---------
+    plt.figure(figsize=(7, 5))
+    summary.plot(kind="bar", color=["green", "red", "orange", "blue"])
+    plt.title("Fraud Detection Outcomes (Hybrid Model)")
+    plt.xlabel("Outcome")
+    plt.ylabel("Number of Customers")
+    plt.xticks(rotation=25)
+    plt.tight_layout()
+
+    plt.savefig(SUMMARY_PLOT)
+    print(f"📈 Fraud summary plot saved to {SUMMARY_PLOT}")
+    plt.close()  # free the figure; show() would block pipeline runs
+
+    print("\n✅ merge_and_analyze.py completed successfully.")
+
+    return merged
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
 # pipeline.py
-import os
+# Stages run in-process — one interpreter, one pandas/sklearn import, and
+# the featurized frame flows between stages instead of a CSV round trip.
+
+import train_model
+import evaluate_and_log
+import merge_and_analyze
 
 print("🚀 Starting full fraud detection pipeline...")
 
-os.system("python train_model.py")
-os.system("python evaluate_and_log.py")
-os.system("python merge_and_analyze.py")
+# merge_and_analyze gets the train-stage frame, not the eval-mutated one —
+# its persistence_rate must come from train_model's labels, exactly as a
+# standalone run reads them back from training_with_synthetics.csv
+df = train_model.main()
+evaluate_and_log.main(df)
+merge_and_analyze.main(df)
 
 print("✅ Pipeline finished! All outputs are saved.")
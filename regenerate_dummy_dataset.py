@@ -0,0 +1,42 @@
+# regenerate_dummy_dataset.py — rebuild data/dummy_billing_dataset.csv
+
+import os
+import pandas as pd
+import numpy as np
+
+# --------- Paths ---------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+os.makedirs(DATA_DIR, exist_ok=True)
+
+OUTPUT_FILE = os.path.join(DATA_DIR, "dummy_billing_dataset.csv")
+
+# --------- Config ---------
+N_CUSTOMERS = 48
+MONTHS = pd.date_range("2025-01-01", periods=6, freq="MS")
+CATEGORIES = ["Residential", "Commercial", "Industrial"]
+
+# --------- Generate (fully vectorized — no per-row Python loop) ---------
+# All draws happen as (n_customers, n_months) arrays in one shot; the frame
+# is assembled from flattened columns via repeat/tile.
+rng = np.random.default_rng(42)
+n_c, n_m = N_CUSTOMERS, len(MONTHS)
+
+base = rng.integers(100, 1000, size=n_c)[:, None]          # per-customer baseline
+noise = rng.integers(-50, 50, size=(n_c, n_m))             # month-to-month wobble
+consumption = (base + noise).astype(float)
+billed = consumption * rng.uniform(0.9, 1.1, size=(n_c, n_m))
+categories = rng.choice(CATEGORIES, size=n_c)
+
+customers = np.array([f"CUST_{i:03d}" for i in range(1, n_c + 1)])
+
+df = pd.DataFrame({
+    "customer_id": np.repeat(customers, n_m),
+    "month": np.tile(MONTHS, n_c),
+    "consumption_kwh": consumption.ravel().round(2),
+    "billed_kwh": billed.ravel().round(2),
+    "consumer_category": np.repeat(categories, n_m),
+})
+
+df.to_csv(OUTPUT_FILE, index=False)
+print(f"✅ Dummy billing dataset regenerated at {OUTPUT_FILE} ({len(df)} rows)")
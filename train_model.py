@@ -8,6 +8,12 @@ from sklearn.neighbors import LocalOutlierFactor
 from sklearn.preprocessing import MinMaxScaler
 import joblib
 from utils.synthetic import inject_synthetic_anomalies_per_customer  # ✅ use utility
+from utils.io import save_df  # CSV + Parquet sibling for intermediates
+
+try:
+    from numba import njit  # optional — fused feature-engineering kernel
+except ImportError:
+    njit = None
 
 # --------- Paths ---------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -15,139 +21,297 @@ DATA_DIR = os.path.join(BASE_DIR, "data")
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
-# --------- Load Data ---------
-df = pd.read_csv(os.path.join(DATA_DIR, "dummy_billing_dataset.csv"), parse_dates=["month"])
+FEATURES = [
+    "consumption_kwh",
+    "billed_kwh",
+    "ratio",
+    "monthly_change",
+    "cat_dev",
+    "billing_gap",
+]
+
+# Explicit dtypes skip inference; category columns hash int codes in every
+# downstream groupby and float32 halves the feature-matrix footprint
+BILLING_DTYPES = {
+    "customer_id": "category",
+    "consumer_category": "category",
+    "consumption_kwh": "float32",
+    "billed_kwh": "float32",
+}
+
 
 # --------- Feature Engineering ---------
+if njit is not None:
+
+    @njit(cache=True, fastmath=True)
+    def _feature_kernel(cons, bill, cust_codes, cat_codes, cat_means):
+        """All four derived columns in one fused loop — one memory pass
+        instead of an intermediate allocation per column."""
+        n = cons.size
+        ratio = np.empty(n)
+        mc = np.empty(n)
+        cat_dev = np.empty(n)
+        gap = np.empty(n)
+        for i in range(n):
+            ratio[i] = bill[i] / (cons[i] + 1.0)
+            if i > 0 and cust_codes[i] == cust_codes[i - 1]:
+                mc[i] = cons[i] - cons[i - 1]
+            else:
+                mc[i] = 0.0
+            cat_dev[i] = cons[i] - cat_means[cat_codes[i]]
+            gap[i] = cons[i] - bill[i]
+        return ratio, mc, cat_dev, gap
+
+    # warm up the JIT at import so the first training run doesn't pay compile cost
+    _feature_kernel(
+        np.zeros(1), np.zeros(1), np.zeros(1, np.int64), np.zeros(1, np.int64), np.zeros(1)
+    )
+
+
 def add_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Derive ratio/monthly_change/cat_dev/billing_gap.
+
+    Invariant: the returned frame is sorted by (customer_id, month) —
+    downstream grouped shifts rely on it, and every later groupby passes
+    sort=False because no further key sort is needed.
+    """
     df = df.sort_values(["customer_id", "month"]).copy()
+    cons = df["consumption_kwh"].to_numpy(dtype=float)
+    bill = df["billed_kwh"].to_numpy(dtype=float)
+
+    if njit is not None:
+        cust_codes = pd.factorize(df["customer_id"])[0]
+        cat_codes, _ = pd.factorize(df["consumer_category"])
+        # per-category means via bincount — single histogram pass
+        cat_means = np.bincount(cat_codes, weights=cons) / np.bincount(cat_codes)
+        ratio, mc, cat_dev, gap = _feature_kernel(cons, bill, cust_codes, cat_codes, cat_means)
+        df["ratio"], df["monthly_change"] = ratio, mc
+        df["cat_dev"], df["billing_gap"] = cat_dev, gap
+        return df
 
     # Core ratios
     df["ratio"] = df["billed_kwh"] / (df["consumption_kwh"] + 1)
-    df["monthly_change"] = df.groupby("customer_id")["consumption_kwh"].diff().fillna(0)
 
-    # Category-level deviation
-    category_avg = df.groupby("consumer_category")["consumption_kwh"].transform("mean")
-    df["cat_dev"] = df["consumption_kwh"] - category_avg
+    # Grouped diff as a plain shift-subtract over the sorted frame, zeroed
+    # where the customer changes — no groupby machinery for one lag
+    cust_arr = df["customer_id"].to_numpy()
+    mc = np.zeros(len(df))
+    same_prev = cust_arr[1:] == cust_arr[:-1]
+    mc[1:] = np.where(same_prev, cons[1:] - cons[:-1], 0.0)
+    df["monthly_change"] = mc
+
+    # Category-level deviation — aggregate once, then broadcast with map
+    # instead of transform's per-group materialization. astype(float)
+    # because mapping a categorical column yields categorical output.
+    category_avg = df.groupby("consumer_category", sort=False, observed=True)["consumption_kwh"].mean()
+    df["cat_dev"] = df["consumption_kwh"] - df["consumer_category"].map(category_avg).astype(float)
 
     # Billing gap
     df["billing_gap"] = df["consumption_kwh"] - df["billed_kwh"]
 
     return df
 
-df = add_features(df)
 
-# --------- Step 1: Inject Synthetic Anomalies ---------
-df = inject_synthetic_anomalies_per_customer(
-    df, customer_frac=0.05, months_frac=0.3, seed=42
-)
+def main(df: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Train the hybrid anomaly models; returns the featurized frame with
+    synthetics so downstream stages can reuse it in-process."""
+    # --------- Load Data ---------
+    if df is None:
+        df = pd.read_csv(
+            os.path.join(DATA_DIR, "dummy_billing_dataset.csv"),
+            engine="pyarrow",  # multi-threaded CSV parse
+            dtype=BILLING_DTYPES,
+            parse_dates=["month"],
+        )
+    # No-op when loaded through BILLING_DTYPES; covers frames handed in
+    # directly so every groupby below keys on int codes
+    df["customer_id"] = df["customer_id"].astype("category")
+    df["consumer_category"] = df["consumer_category"].astype("category")
 
-# --------- Step 2: Features ---------
-FEATURES = [
-    "consumption_kwh",
-    "billed_kwh",
-    "ratio",
-    "monthly_change",
-    "cat_dev",
-    "billing_gap",
-]
-X = df[FEATURES].fillna(0)
-
-# --------- Step 3: Load Best Params (if available) ---------
-best_params_path = os.path.join(MODEL_DIR, "best_params.pkl")
-if os.path.exists(best_params_path):
-    best_params = joblib.load(best_params_path)
-    print("✅ Loaded best params from Optuna:", best_params)
-else:
-    print("⚠️ No tuned params found, falling back to defaults.")
-    best_params = {
-        "iso_contamination": 0.05,
-        "n_estimators": 100,
-        "max_samples": 0.8,
-        "lof_n_neighbors": 20,
-        "lof_contamination": 0.05,
-        "alpha": 0.5,
-    }
-
-
-# --------- Step 4: Train Models with Tuned Params ---------
-# Scale original FEATURES for consistency with inference and training
-feature_scaler = MinMaxScaler()
-X_scaled = feature_scaler.fit_transform(X)
-
-# Isolation Forest trained on scaled features
-iso = IsolationForest(
-    contamination=best_params["iso_contamination"],
-    n_estimators=best_params["n_estimators"],
-    max_samples=best_params["max_samples"],
-    random_state=42,
-)
-df["iso_pred"] = iso.fit_predict(X_scaled)
-# Use score_samples on the scaled features
-df["iso_score"] = iso.score_samples(X_scaled)
-
-# Local Outlier Factor trained on scaled features
-lof = LocalOutlierFactor(
-    n_neighbors=best_params["lof_n_neighbors"],
-    contamination=best_params["lof_contamination"],
-)
-df["lof_pred"] = lof.fit_predict(X_scaled)
-
-# --------- Step 5: Improved Hybrid Scoring ---------
-# Normalize the iso_score and lof_pred for hybrid scoring
-df["iso_norm"] = MinMaxScaler().fit_transform(df[["iso_score"]])
-df["lof_norm"] = MinMaxScaler().fit_transform(np.abs(df[["lof_pred"]]))  # LOF outputs -1/1 → abs makes consistent
-
-alpha = best_params.get("alpha", 0.5)
-df["combined_score"] = alpha * df["iso_norm"] + (1 - alpha) * df["lof_norm"]
-
-# --- Rule-based anomaly (both under & over billing) ---
-under_flag = (df["ratio"] < 0.85).astype(int)
-over_flag = (df["ratio"] > 1.3).astype(int)
-df["rule_flag"] = under_flag | over_flag
-
-# --- Penalize rule-based issues mildly since normalized ---
-df["final_score"] = df["combined_score"] - df["rule_flag"] * 0.2
-
-# --- Label anomalies: lowest 5% as anomalies ---
-threshold = df["final_score"].quantile(0.05)
-# ✅ Use -1 for anomaly, 1 for normal consistently
-df["anomaly_label"] = np.where(df["final_score"] < threshold, -1, 1)
-
-# --- Persistence filter: anomaly in 2+ consecutive months ---
-df["persistent_anomaly"] = (
-    df.groupby("customer_id")["anomaly_label"]
-    .rolling(2)
-    .apply(lambda x: (x == -1).sum(), raw=True)
-    .reset_index(0, drop=True)
-    .ge(2)
-    .astype(int)
-)
-
-# --------- Step 6: Save Outputs ---------
-# Top 50 suspicious customers (based on persistence first)
-top50 = (
-    df.groupby("customer_id")["persistent_anomaly"]
-    .mean()
-    .sort_values(ascending=False)
-    .head(50)
-    .reset_index()
-)
-top50.to_csv(os.path.join(DATA_DIR, "top50_suspicious_customers.csv"), index=False)
-
-# Save Isolation Forest model
-joblib.dump(iso, os.path.join(MODEL_DIR, "anomaly_model.pkl"))
-
-# ✅ Save feature scaler (fitted on original FEATURES)
-joblib.dump(feature_scaler, os.path.join(MODEL_DIR, "scaler.pkl"))
-
-# Save processed dataset with features + synthetic anomalies
-df.to_csv(os.path.join(DATA_DIR, "training_with_synthetics.csv"), index=False)
-
-# --------- Logging ---------
-print(f"✅ Model saved to {os.path.join(MODEL_DIR, 'anomaly_model.pkl')}")
-print(f"✅ Scaler saved to {os.path.join(MODEL_DIR, 'scaler.pkl')}")
-print(f"✅ Top 50 suspicious customers saved to {os.path.join(DATA_DIR, 'top50_suspicious_customers.csv')}")
-print(f"✅ Training dataset with synthetics saved to {os.path.join(DATA_DIR, 'training_with_synthetics.csv')}")
-print(f"⚡ Injected {df['is_synthetic'].sum()} synthetic anomalies for training.")
-print("✅ Improved anomaly logic: normalized, under+over billing handled, persistence check added.")
+    # One flat index over the (customer_id, month)-sorted frame — set once
+    # here so nothing downstream pays for another sort or index realign
+    df = add_features(df).reset_index(drop=True)
+
+    # Pre-injection feature snapshot for the generate_top50 cache: that
+    # script audits the real data, so its matrix must not carry the
+    # synthetic corruption injected below
+    X_clean = df[FEATURES].to_numpy(dtype=np.float32, na_value=0.0)
+
+    # --------- Step 1: Inject Synthetic Anomalies ---------
+    df = inject_synthetic_anomalies_per_customer(
+        df, customer_frac=0.05, months_frac=0.3, seed=42
+    )
+
+    # The injector mutates raw kwh on a small subset of rows, so patch the
+    # derived columns in place for exactly those rows (plus the next row of
+    # the same customer for monthly_change) rather than re-running
+    # add_features over the whole frame. Category means are re-aggregated
+    # once (a cheap reduction); untouched rows keep their original cat_dev —
+    # the mean drift from a handful of corrupted rows is negligible.
+    touched = np.flatnonzero(df["is_synthetic"].to_numpy() == 1)
+    if touched.size:
+        cons = df["consumption_kwh"].to_numpy(dtype=float)
+        bill = df["billed_kwh"].to_numpy(dtype=float)
+        # .copy(): to_numpy may hand back read-only views of the blocks
+        ratio = df["ratio"].to_numpy().copy()
+        gap = df["billing_gap"].to_numpy().copy()
+        cat_dev = df["cat_dev"].to_numpy().copy()
+        mc = df["monthly_change"].to_numpy().copy()
+
+        ratio[touched] = bill[touched] / (cons[touched] + 1.0)
+        gap[touched] = cons[touched] - bill[touched]
+
+        category_avg = df.groupby("consumer_category", sort=False, observed=True)[
+            "consumption_kwh"
+        ].mean()
+        row_means = df["consumer_category"].map(category_avg).astype(float).to_numpy()
+        cat_dev[touched] = cons[touched] - row_means[touched]
+
+        # monthly_change depends on the previous row, so the touched rows
+        # and each touched row's successor both need a refresh
+        same_prev = np.zeros(len(df), dtype=bool)
+        cust_arr = df["customer_id"].to_numpy()
+        same_prev[1:] = cust_arr[1:] == cust_arr[:-1]
+        rows = np.unique(np.concatenate([touched, touched + 1]))
+        rows = rows[rows < len(df)]
+        mc[rows] = np.where(same_prev[rows], cons[rows] - cons[np.maximum(rows - 1, 0)], 0.0)
+
+        df["ratio"], df["billing_gap"] = ratio, gap
+        df["cat_dev"], df["monthly_change"] = cat_dev, mc
+
+    # --------- Step 2: Features ---------
+    # float32 from the start — na_value fills during extraction, so no
+    # float64 intermediate or separate fillna copy
+    X = df[FEATURES].to_numpy(dtype=np.float32, na_value=0.0)
+
+    # --------- Step 3: Load Best Params (if available) ---------
+    best_params_path = os.path.join(MODEL_DIR, "best_params.pkl")
+    if os.path.exists(best_params_path):
+        best_params = joblib.load(best_params_path)
+        print("✅ Loaded best params from Optuna:", best_params)
+    else:
+        print("⚠️ No tuned params found, falling back to defaults.")
+        best_params = {
+            "iso_contamination": 0.05,
+            "n_estimators": 100,
+            "max_samples": 0.8,
+            "lof_n_neighbors": 20,
+            "lof_contamination": 0.05,
+            "alpha": 0.5,
+        }
+
+    # --------- Step 4: Train Models with Tuned Params ---------
+    # Scale original FEATURES for consistency with inference and training;
+    # contiguous float32 halves memory bandwidth through tree traversal
+    feature_scaler = MinMaxScaler()
+    X_scaled = np.ascontiguousarray(feature_scaler.fit_transform(X), dtype=np.float32)
+
+    # Isolation Forest trained on scaled features. Parallel fit only pays
+    # off once joblib's worker overhead is amortized — stay single-process
+    # for small frames.
+    iso = IsolationForest(
+        contamination=best_params["iso_contamination"],
+        n_estimators=best_params["n_estimators"],
+        max_samples=best_params["max_samples"],
+        n_jobs=-1 if len(X) > 4096 else 1,
+        random_state=42,
+    )
+    df["iso_pred"] = iso.fit_predict(X_scaled)
+    # Use score_samples on the scaled features
+    df["iso_score"] = iso.score_samples(X_scaled)
+
+    # Local Outlier Factor trained on scaled features
+    lof = LocalOutlierFactor(
+        n_neighbors=best_params["lof_n_neighbors"],
+        contamination=best_params["lof_contamination"],
+    )
+    df["lof_pred"] = lof.fit_predict(X_scaled)
+
+    # --------- Step 5: Improved Hybrid Scoring ---------
+    # Normalize the iso_score and lof_pred for hybrid scoring — closed-form
+    # min-max on the raw arrays; no scaler object or check_array validation
+    # for a single-column rescale. The (min, max) bounds are kept so they
+    # can be persisted and reapplied to new batches at inference time.
+    iso_scores = df["iso_score"].to_numpy()
+    lof_abs = np.abs(df["lof_pred"].to_numpy())  # LOF outputs -1/1 → abs makes consistent
+    iso_min, iso_max = iso_scores.min(), iso_scores.max()
+    lof_min, lof_max = lof_abs.min(), lof_abs.max()
+    df["iso_norm"] = (iso_scores - iso_min) / (iso_max - iso_min + 1e-12)
+    df["lof_norm"] = (lof_abs - lof_min) / (lof_max - lof_min + 1e-12)
+
+    alpha = best_params.get("alpha", 0.5)
+    # Single eval (numexpr-backed when available): combined score, the
+    # under/over-billing rule flag and the penalized final score stream
+    # through one fused pass instead of allocating each intermediate column
+    # in its own DRAM round trip
+    df.eval(
+        "combined_score = @alpha * iso_norm + (1 - @alpha) * lof_norm\n"
+        "rule_flag = ((ratio < 0.85) | (ratio > 1.3)) * 1\n"
+        "final_score = combined_score - rule_flag * 0.2",
+        inplace=True,
+    )
+
+    # --- Label anomalies: lowest 5% as anomalies ---
+    threshold = df["final_score"].quantile(0.05)
+    # ✅ Use -1 for anomaly, 1 for normal consistently
+    df["anomaly_label"] = np.where(df["final_score"] < threshold, -1, 1)
+
+    # --- Persistence filter: anomaly in 2+ consecutive months ---
+    # Equivalent to current & previous label both -1 — one grouped shift and
+    # a boolean AND instead of a Python lambda per rolling window
+    prev_label = df.groupby("customer_id", sort=False, observed=True)["anomaly_label"].shift(1)
+    df["persistent_anomaly"] = ((df["anomaly_label"] == -1) & (prev_label == -1)).astype(np.int8)
+
+    # --------- Step 6: Save Outputs ---------
+    # Top 50 suspicious customers (based on persistence first)
+    top50 = (
+        df.groupby("customer_id", sort=False, observed=True)["persistent_anomaly"]
+        .mean()
+        .sort_values(ascending=False)
+        .head(50)
+        .reset_index()
+    )
+    save_df(top50, os.path.join(DATA_DIR, "top50_suspicious_customers.csv"))
+
+    # Save Isolation Forest model
+    joblib.dump(iso, os.path.join(MODEL_DIR, "anomaly_model.pkl"))
+
+    # ✅ Save feature scaler (fitted on original FEATURES)
+    joblib.dump(feature_scaler, os.path.join(MODEL_DIR, "scaler.pkl"))
+
+    # Save score-normalization bounds so new batches rescale consistently
+    joblib.dump(
+        {"iso": (iso_min, iso_max), "lof": (lof_min, lof_max)},
+        os.path.join(MODEL_DIR, "score_norm.pkl"),
+    )
+
+    # Cache a scaled feature matrix + row-aligned customer index so
+    # generate_top50.py can score directly without re-reading the CSV and
+    # re-running feature engineering. Transformed from the pre-injection
+    # snapshot — the training matrix above contains synthetic corruption
+    # that must not leak into the real suspicious-customer report — so the
+    # cache matches what generate_top50's fallback path computes itself.
+    np.save(
+        os.path.join(DATA_DIR, "X_scaled.npy"),
+        np.ascontiguousarray(feature_scaler.transform(X_clean), dtype=np.float32),
+    )
+    df[["customer_id"]].reset_index(drop=True).to_parquet(
+        os.path.join(DATA_DIR, "customer_index.parquet")
+    )
+
+    # Save processed dataset with features + synthetic anomalies
+    save_df(df, os.path.join(DATA_DIR, "training_with_synthetics.csv"))
+
+    # --------- Logging ---------
+    print(f"✅ Model saved to {os.path.join(MODEL_DIR, 'anomaly_model.pkl')}")
+    print(f"✅ Scaler saved to {os.path.join(MODEL_DIR, 'scaler.pkl')}")
+    print(f"✅ Top 50 suspicious customers saved to {os.path.join(DATA_DIR, 'top50_suspicious_customers.csv')}")
+    print(f"✅ Training dataset with synthetics saved to {os.path.join(DATA_DIR, 'training_with_synthetics.csv')}")
+    print(f"⚡ Injected {df['is_synthetic'].sum()} synthetic anomalies for training.")
+    print("✅ Improved anomaly logic: normalized, under+over billing handled, persistence check added.")
+
+    return df
+
+
+if __name__ == "__main__":
+    main()
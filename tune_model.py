@@ -7,8 +7,15 @@ import joblib
 import optuna
 from sklearn.ensemble import IsolationForest
 from sklearn.neighbors import LocalOutlierFactor
-from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import f1_score
+from threadpoolctl import threadpool_limits
+
+from utils.io import load_df
+
+try:
+    import numexpr as ne  # optional — fuses the per-trial scoring expression
+except ImportError:
+    ne = None
 
 # -------- Paths --------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,7 +24,16 @@ MODEL_DIR = os.path.join(BASE_DIR, "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
 # -------- Load Data --------
-df = pd.read_csv(os.path.join(DATA_DIR, "training_with_synthetics.csv"))
+# Parquet sibling preferred (written by train_model.py's save_df) —
+# categorical key dtypes survive the round trip and numeric columns skip
+# the text re-parse
+df = load_df(
+    os.path.join(DATA_DIR, "training_with_synthetics.csv"),
+    engine="pyarrow",
+    dtype={"customer_id": "category", "consumer_category": "category",
+           "consumption_kwh": "float32", "billed_kwh": "float32"},
+    parse_dates=["month"],
+)
 
 FEATURES = [
     "consumption_kwh",
@@ -27,10 +43,49 @@ FEATURES = [
     "cat_dev",
     "billing_gap",
 ]
-X = df[FEATURES].fillna(0)
-
-# Synthetic anomalies = -1, normal = 1
-y = df["is_synthetic"].apply(lambda x: -1 if x == 1 else 1)
+# One float32 ndarray shared by every trial — half the float64 footprint,
+# and IF/LOF only compare feature values so nothing is lost. Read-only so
+# no fit can silently trigger a defensive copy-on-write.
+X = df[FEATURES].to_numpy(dtype=np.float32, na_value=0.0)
+X.flags.writeable = False
+RATIO = df["ratio"].to_numpy(dtype=np.float32)
+
+# Synthetic anomalies = -1, normal = 1 — one vectorized compare, not a
+# Python lambda per row
+y = np.where(df["is_synthetic"].to_numpy() == 1, -1, 1).astype(np.int8)
+
+# Row i shares a customer with row i-1 (frame is (customer_id, month)
+# sorted) — computed once; the per-trial persistence check is pure NumPy
+cust_arr = df["customer_id"].to_numpy()
+SAME_CUST = np.zeros(len(df), dtype=bool)
+SAME_CUST[1:] = cust_arr[1:] == cust_arr[:-1]
+
+
+# Stratified search subsample: every synthetic row plus up to 18k sampled
+# normals. LOF's neighbor queries scale badly with N, so trials run on the
+# subsample; the winning params are refit on the full frame downstream
+# (train_model.py consumes best_params.pkl). Indices stay sorted so
+# persistence still means "adjacent months of the same customer" — a pair
+# only counts when the two original rows were consecutive.
+rng = np.random.default_rng(42)
+_normal_idx = np.flatnonzero(y == 1)
+_synth_idx = np.flatnonzero(y == -1)
+sub_idx = np.sort(np.r_[
+    rng.choice(_normal_idx, min(18000, _normal_idx.size), replace=False),
+    _synth_idx,
+])
+X_SUB = X[sub_idx]
+Y_SUB = y[sub_idx]
+RATIO_SUB = RATIO[sub_idx]
+SAME_CUST_SUB = np.zeros(sub_idx.size, dtype=bool)
+SAME_CUST_SUB[1:] = SAME_CUST[sub_idx[1:]] & (np.diff(sub_idx) == 1)
+
+
+def _minmax(a):
+    """Closed-form min-max scaling — no sklearn object allocation or
+    validation overhead for a one-column rescale."""
+    lo = a.min()
+    return (a - lo) / (a.max() - lo + 1e-12)
 
 # -------- Objective Function --------
 def objective(trial):
@@ -45,66 +100,105 @@ def objective(trial):
     over_cutoff = trial.suggest_float("over_cutoff", 1.2, 1.4)
 
     # -------- Isolation Forest --------
+    # Trials already run n_jobs=cpu_count() threads — keep each fit
+    # single-threaded so the trial pool isn't oversubscribed
     iso = IsolationForest(
         contamination=iso_cont,
         n_estimators=n_estimators,
         max_samples=max_samples,
+        n_jobs=1,
         random_state=42
     )
     # ✅ Use score_samples for consistent scoring direction (higher = more anomalous)
-    iso_scores = iso.fit(X).score_samples(X)
+    # threadpool_limits(1): native BLAS/OpenMP pools inside sklearn would
+    # otherwise multiply against the cpu_count() trial threads
+    with threadpool_limits(limits=1):
+        iso_scores = iso.fit(X_SUB).score_samples(X_SUB)
+
+    # Cheap iso-only intermediate signal — lets the median pruner kill
+    # obviously-bad trials before paying for the expensive LOF fit
+    k = iso_scores.size // 20  # bottom 5%
+    inter_preds = np.where(iso_scores < np.partition(iso_scores, k)[k], -1, 1)
+    trial.report(f1_score(Y_SUB, inter_preds, pos_label=-1, zero_division=0), step=0)
+    if trial.should_prune():
+        raise optuna.TrialPruned()
 
     # -------- LOF (novelty=True for scoring consistency) --------
+    # Explicit kd_tree keeps neighbor search O(N log N) — the auto
+    # heuristic can fall back to brute force. n_jobs stays 1: trials are
+    # already thread-parallel.
     lof = LocalOutlierFactor(
         n_neighbors=lof_n_neighbors,
         contamination=lof_cont,
-        novelty=True
+        novelty=True,
+        algorithm="kd_tree",
+        leaf_size=40,
+        n_jobs=1,
     )
-    lof.fit(X)
-    lof_pred = lof.predict(X)
+    with threadpool_limits(limits=1):
+        lof.fit(X_SUB)
+        lof_pred = lof.predict(X_SUB)
 
     # -------- Normalize Scores --------
-    scaler = MinMaxScaler()
-    iso_norm = scaler.fit_transform(iso_scores.reshape(-1, 1)).ravel()
-    lof_norm = scaler.fit_transform(np.abs(lof_pred).reshape(-1, 1)).ravel()
-
-    combined_score = alpha * iso_norm + (1 - alpha) * lof_norm
+    iso_norm = _minmax(iso_scores)
+    lof_norm = _minmax(np.abs(lof_pred))
 
     # -------- Rule-based Anomalies (under + over billing) --------
-    under_flag = (df["ratio"] < under_cutoff).astype(int)
-    over_flag = (df["ratio"] > over_cutoff).astype(int)
-    rule_flag = under_flag | over_flag
-
-    # Apply mild rule penalty
-    final_score = combined_score - rule_flag * 0.2
+    # One boolean expression over the precomputed ratio array
+    rule_flag = (RATIO_SUB < under_cutoff) | (RATIO_SUB > over_cutoff)
+
+    # Blend + rule penalty in float32, int8 labels below. With numexpr
+    # the whole expression runs as one streaming pass — inputs read once,
+    # no combined_score / penalty temporaries round-tripping through DRAM.
+    if ne is not None:
+        final_score = ne.evaluate(
+            "a * iso + (1 - a) * lof - r * 0.2",
+            local_dict={
+                "a": np.float32(alpha),
+                "iso": iso_norm.astype(np.float32),
+                "lof": lof_norm.astype(np.float32),
+                "r": rule_flag.astype(np.float32),
+            },
+        )
+    else:
+        combined_score = (alpha * iso_norm + (1 - alpha) * lof_norm).astype(np.float32)
+        final_score = combined_score - rule_flag * np.float32(0.2)
 
     # -------- Anomaly Threshold --------
-    threshold = np.percentile(final_score, 5)
-    preds = np.where(final_score < threshold, -1, 1)
+    # k-th order statistic via introselect — O(n), no full sort
+    k = final_score.size // 20  # bottom 5%
+    threshold = np.partition(final_score, k)[k]
+    preds = np.where(final_score < threshold, np.int8(-1), np.int8(1))
 
     # -------- Persistence Factor --------
-    df_temp = df.copy()
-    df_temp["anomaly_label"] = preds
-    df_temp["persistent_anomaly"] = (
-        df_temp.groupby("customer_id")["anomaly_label"]
-        .rolling(2)
-        .sum()
-        .reset_index(0, drop=True)
-        .ge(2)
-        .astype(int)
-    )
-    persistence_weight = df_temp["persistent_anomaly"].mean()  # average persistence
+    # Anomalous (-1) in the current and previous month of the same
+    # customer — one boolean pass, no per-trial frame copy or groupby
+    persistent = np.zeros(preds.size, dtype=bool)
+    persistent[1:] = (preds[1:] == -1) & (preds[:-1] == -1) & SAME_CUST_SUB[1:]
+    persistence_weight = persistent.mean()  # average persistence
 
     # -------- F1 Score --------
-    f1 = f1_score(y, preds, pos_label=-1, zero_division=0)
+    f1 = f1_score(Y_SUB, preds, pos_label=-1, zero_division=0)
 
     # Encourage models that catch persistent anomalies
     score = f1 * (0.9 + 0.1 * persistence_weight)
     return score
 
 # -------- Run Study --------
-study = optuna.create_study(direction="maximize")
-study.optimize(objective, n_trials=50)
+# SQLite storage makes the study resumable across runs; trials fan out
+# over all cores and the median pruner cuts short hopeless ones
+study = optuna.create_study(
+    study_name="wattaudit_hybrid",
+    storage=f"sqlite:///{os.path.join(BASE_DIR, 'optuna.db')}",
+    load_if_exists=True,
+    direction="maximize",
+    sampler=optuna.samplers.TPESampler(multivariate=True, group=True),
+    # n_startup_trials (not n_warmup_steps): the objective reports once at
+    # step 0, so any step-based warmup would disable pruning outright —
+    # instead let the first five trials complete to seed the medians
+    pruner=optuna.pruners.MedianPruner(n_startup_trials=5),
+)
+study.optimize(objective, n_trials=50, n_jobs=os.cpu_count(), gc_after_trial=True)
 
 print("✅ Best params found:")
 for k, v in study.best_params.items():
@@ -116,12 +210,12 @@ best_params = study.best_params
 joblib.dump(best_params, os.path.join(MODEL_DIR, "best_params.pkl"))
 
 # -------- Save Results --------
+# Append the new row instead of read→concat→rewrite of the whole log
 results_path = os.path.join(DATA_DIR, "tuning_results.csv")
 df_results = pd.DataFrame([{**study.best_params, "best_f1": study.best_value}])
-if os.path.exists(results_path):
-    old = pd.read_csv(results_path)
-    df_results = pd.concat([old, df_results], ignore_index=True)
-df_results.to_csv(results_path, index=False)
+df_results.to_csv(
+    results_path, mode="a", header=not os.path.exists(results_path), index=False
+)
 
 print(f"📊 Tuning results saved to {results_path}")
 print("⚡ Hybrid anomaly logic: normalized IF+LOF, under+over rules, persistence weighting.")
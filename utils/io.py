@@ -0,0 +1,37 @@
+import os
+import pandas as pd
+
+
+def save_df(df: pd.DataFrame, csv_path: str) -> None:
+    """
+    Save an intermediate artifact as CSV plus a typed Parquet sibling.
+    Downstream stages read the Parquet (5-10x fewer bytes, dtypes kept,
+    no date/categorical re-parse); the CSV stays for human inspection.
+    """
+    df.to_csv(csv_path, index=False)
+    try:
+        df.to_parquet(
+            os.path.splitext(csv_path)[0] + ".parquet",
+            engine="pyarrow",
+            compression="zstd",
+        )
+    except Exception:
+        pass  # pyarrow unavailable — CSV alone still works
+
+
+def load_df(csv_path: str, **read_csv_kwargs) -> pd.DataFrame:
+    """
+    Load an intermediate artifact, preferring the Parquet sibling when it
+    is at least as fresh as the CSV. Falls back to pd.read_csv with the
+    given kwargs.
+    """
+    parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+    try:
+        if os.path.exists(parquet_path) and (
+            not os.path.exists(csv_path)
+            or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)
+        ):
+            return pd.read_parquet(parquet_path, engine="pyarrow")
+    except Exception:
+        pass
+    return pd.read_csv(csv_path, **read_csv_kwargs)
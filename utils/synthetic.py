@@ -1,4 +1,4 @@
-﻿import numpy as np
+import numpy as np
 import pandas as pd
 
 def inject_synthetic_anomalies_per_customer(df, customer_frac=0.1, months_frac=0.3, seed=42):
@@ -8,53 +8,73 @@ def inject_synthetic_anomalies_per_customer(df, customer_frac=0.1, months_frac=0
     - months_frac: fraction of months per selected customer
     - seed: random seed
     Returns dataframe with 'is_synthetic' column (0/1).
+
+    Fully vectorized: customer choice, per-customer month choice, fraud
+    modes and multipliers are all drawn as arrays from a local Generator
+    (no np.random.seed global state), and each fraud mode is applied as
+    one masked array op — zero Python loops over rows.
     """
-    np.random.seed(seed)
-    df = df.copy()
-    df["is_synthetic"] = 0
-
-    customers = df["customer_id"].unique()
-    n_customers = len(customers)
-    k = max(1, int(n_customers * customer_frac))  # pick some customers
-    chosen_customers = np.random.choice(customers, size=k, replace=False)
-
-    for cust in chosen_customers:
-        cust_mask = df["customer_id"] == cust
-        cust_rows = df.loc[cust_mask]
-        months = cust_rows["month"].unique()
-        if len(months) == 0:
-            continue
-        m = max(1, int(len(months) * months_frac))
-        chosen_months = np.random.choice(months, size=m, replace=False)
-
-        for mon in chosen_months:
-            idx = cust_rows[cust_rows["month"] == mon].index
-            if len(idx) == 0:
-                continue
-            i = idx[0]
-
-            # Pick one fraud scenario
-            mode = np.random.choice([
-                "underbilling",   # billed far less than consumed
-                "zero_consumption", # 0 consumption but billed anyway
-                "spike",          # sudden huge spike
-                "flatline",       # sudden drop to near zero
-                "seasonal_shift"  # very different than usual pattern
-            ])
-
-            if mode == "underbilling":
-                df.at[i, "billed_kwh"] = df.at[i, "billed_kwh"] * np.random.uniform(0.05, 0.4)
-            elif mode == "zero_consumption":
-                df.at[i, "consumption_kwh"] = 0
-                df.at[i, "billed_kwh"] *= np.random.uniform(1.2, 1.5)
-            elif mode == "spike":
-                df.at[i, "consumption_kwh"] *= np.random.uniform(4, 10)
-            elif mode == "flatline":
-                df.at[i, "consumption_kwh"] *= np.random.uniform(0.0, 0.1)
-            elif mode == "seasonal_shift":
-                df.at[i, "consumption_kwh"] *= np.random.uniform(0.2, 0.4)
-                df.at[i, "billed_kwh"] *= np.random.uniform(1.2, 1.5)
-
-            df.at[i, "is_synthetic"] = 1
+    rng = np.random.default_rng(seed)
+    # reset_index so positional numpy ops line up with the column buffers
+    df = df.copy().reset_index(drop=True)
+
+    cust_codes, cust_uniques = pd.factorize(df["customer_id"], sort=False)
+    n_customers = len(cust_uniques)
+    k = max(1, int(n_customers * customer_frac))
+    chosen = rng.choice(n_customers, size=k, replace=False)
+    chosen_mask = np.isin(cust_codes, chosen)
+
+    # Pick months_frac of each chosen customer's rows: rank every row
+    # randomly within its customer via one lexsort, then keep the first
+    # m rows per customer (m = max(1, n_months * months_frac))
+    counts = np.bincount(cust_codes)
+    m_per_cust = np.maximum(1, (counts * months_frac).astype(int))
+
+    r = rng.random(len(df))
+    order = np.lexsort((r, cust_codes))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.empty(len(df), dtype=np.int64)
+    rank[order] = np.arange(len(df)) - np.repeat(starts, counts)
+
+    pos = np.flatnonzero(chosen_mask & (rank < m_per_cust[cust_codes]))
+
+    is_synthetic = np.zeros(len(df), dtype=np.int8)
+    if pos.size == 0:
+        df["is_synthetic"] = is_synthetic
+        return df
+
+    # One fraud scenario per target, drawn as a batch:
+    #   0 underbilling     — billed far less than consumed
+    #   1 zero_consumption — 0 consumption but billed anyway
+    #   2 spike            — sudden huge spike
+    #   3 flatline         — sudden drop to near zero
+    #   4 seasonal_shift   — very different than usual pattern
+    modes = rng.integers(0, 5, size=pos.size)
+
+    cons = df["consumption_kwh"].to_numpy().copy()
+    bill = df["billed_kwh"].to_numpy().copy()
+
+    under = pos[modes == 0]
+    bill[under] *= rng.uniform(0.05, 0.4, size=under.size)
+
+    zero = pos[modes == 1]
+    cons[zero] = 0
+    bill[zero] *= rng.uniform(1.2, 1.5, size=zero.size)
+
+    spike = pos[modes == 2]
+    cons[spike] *= rng.uniform(4, 10, size=spike.size)
+
+    flat = pos[modes == 3]
+    cons[flat] *= rng.uniform(0.0, 0.1, size=flat.size)
+
+    seasonal = pos[modes == 4]
+    cons[seasonal] *= rng.uniform(0.2, 0.4, size=seasonal.size)
+    bill[seasonal] *= rng.uniform(1.2, 1.5, size=seasonal.size)
+
+    df["consumption_kwh"] = cons
+    df["billed_kwh"] = bill
+
+    is_synthetic[pos] = 1
+    df["is_synthetic"] = is_synthetic
 
     return df